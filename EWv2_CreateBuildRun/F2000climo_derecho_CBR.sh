@@ -36,6 +36,8 @@ DO_RUN=true
 DO_RESTART=false
 # Remove any CASEROOTS before anything else in create section
 OVERWRITE=false
+# If set, append CASEROOTS to this file instead of case.submit (see pack_cases.py)
+PACK_FILE=""
 
 ## Other configuration variables
 COMP="F2000climo"
@@ -206,11 +208,16 @@ __EOF_NL_CAM
     cd $CASEROOT
     vexec "./check_input_data"
 
-    vexec "./case.submit"
-    if [ "$?" -ne 0 ]; then
-      echo "ERROR: case.submit failed"
-      echo -e "--- End loop for $CASE ---\n"
-      continue
+    if [ -n "$PACK_FILE" ]; then
+      echo "$CASEROOT" >> "$PACK_FILE"
+      echo "NOTE: added $CASE to \"$PACK_FILE\", run it with pack_cases.py"
+    else
+      vexec "./case.submit"
+      if [ "$?" -ne 0 ]; then
+        echo "ERROR: case.submit failed"
+        echo -e "--- End loop for $CASE ---\n"
+        continue
+      fi
     fi
     # End Run case ############################################################
   fi # DO_RUN
@@ -16,6 +16,9 @@ if [ ! -d "${SRCROOT}" ] ; then
 	echo -e "ERROR: SRCROOT not a directory: \"${SRCROOT}\""
 	exit 1
 fi
+## Un-comment to only test the compsets affected by the last Externals.cfg update
+## (overrides COMPS above, see GitScripts/external_test_select.py --help)
+# eval "$(cd ../GitScripts && python3 external_test_select.py --root-dir ${SRCROOT} --format bash)"
 CSEROOT="$(realpath ${PWD}/../../../../cases)"
 [ -d "${CSEROOT}" ] || mkdir -p "${CSEROOT}"
 # Adjust case prefix to whatever makes sense for you
@@ -27,6 +30,10 @@ CMD="_derecho_CBR.sh -id ${INDATA} --srcroot ${SRCROOT} --casesdir ${CSEROOT} --
 # CMD="_derecho_CBR.sh -id ${INDATA} --srcroot ${SRCROOT} --casesdir ${CSEROOT} --res=(${RESS[@]}) --compiler=(${COMPI[@]}) --gpus -cp ${PRE} "
 ## Note the difference in RESS between above and below lines. Arrays don't work for single values correctly
 CMD="_derecho_CBR.sh -id ${INDATA} --srcroot ${SRCROOT} --casesdir ${CSEROOT} --res=${RESS} --compiler=(${COMPI[@]}) -cp ${PRE} "
+## Un-comment to run all cases together in a few packed jobs instead of one
+## case.submit per case (see pack_cases.py --help and the end of this file)
+# PACK_FILE="${CSEROOT}/${PRE}.pack.txt"
+# CMD="${CMD} --pack ${PACK_FILE}"
 
 ## # Un-comment this section to do a dry run
 ## for C in ${COMPS[@]}; do
@@ -50,3 +57,8 @@ for C in ${COMPS[@]}; do
 	LG_FILE="log.buildrun.${PRE}.${C}.txt"
 	./${CCMD} -nc 2>&1 | tee -a $LG_FILE
 done
+
+# Submit the packed jobs if PACK_FILE was used above
+if [ -n "${PACK_FILE}" ] && [ -f "${PACK_FILE}" ]; then
+	python3 pack_cases.py --case-file ${PACK_FILE} --pack-dir ${CSEROOT}/${PRE}.pack_jobs 2>&1 | tee -a log.pack.${PRE}.txt
+fi
@@ -0,0 +1,311 @@
+#!/usr/bin/env python3
+'''
+Compare the netCDF history and restart files in the run directories of two
+cases (or a case and a stored baseline directory) variable by variable and
+report bit-for-bit status or max/RMS differences
+'''
+
+# -- Imports --
+import sys
+import os
+import json
+import hashlib
+import logging
+import subprocess
+from pathlib import Path
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import netCDF4
+# -- Constants --
+LOG_FILE_NAME='compare_runs.log'
+SUMS_FILE_NAME='ew_checksums.json'
+# Largest number of array elements read from a variable at once
+MAX_CHUNK_ELEMS = 2**22
+# Component names that follow the case name in CESM output file names
+COMP_NAMES = ('cam', 'clm2', 'cpl', 'mpaso', 'mpassi', 'cice', 'mosart',
+              'datm', 'docn', 'drof', 'dice', 'slnd', 'sice', 'socn')
+
+
+def parse_args(args=None):
+    '''Setup command-line arguments and parse them'''
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument("test",
+            type=Path,
+            help="Case directory or run directory to check")
+    parser.add_argument("baseline",
+            type=Path,
+            help="Case directory, run directory or stored baseline to compare against")
+    parser.add_argument("--nprocs", "-np",
+            type=int,
+            default=os.cpu_count(),
+            help="Number of files to compare in parallel. Default is the number of CPUs")
+    parser.add_argument("--files",
+            nargs="*",
+            help="Only compare files containing these strings (e.g. cam.h0 cpl.r)")
+    parser.add_argument("--no-store",
+            action="store_true",
+            help=f"Don't write baseline checksums to {SUMS_FILE_NAME} in the baseline directory")
+
+    opts = parser.parse_args(args)
+    return opts
+
+
+def get_rundir(cdir):
+    '''Return RUNDIR if cdir is a case directory, otherwise cdir itself'''
+    if not (cdir / 'env_run.xml').exists():
+        return cdir
+    cmd = ['./xmlquery', 'RUNDIR', '--value']
+    proc = subprocess.run(cmd, cwd=cdir, capture_output=True, text=True, check=False)
+    if proc.returncode != 0:
+        msg = f"- Failed to get RUNDIR for case {str(cdir)}"
+        print(msg)
+        print(f'cmd={cmd}\ncmdOut={proc.stdout}{proc.stderr}\n')
+        return None
+    return Path(proc.stdout.strip())
+
+
+def file_key(fname):
+    '''Return the part of an output file name after the case name'''
+    dname = f'.{fname}.'
+    for part in fname.split('.'):
+        idx = dname.find(f'.{part}.')
+        if part in COMP_NAMES and idx >= 0:
+            return fname[idx:]
+    return None
+
+
+def get_file_dict(rundir, only=None):
+    '''Return a dictionary of file key to path for the netCDF files in rundir'''
+    ret = {}
+    for fpath in sorted(rundir.glob('*.nc')):
+        key = file_key(fpath.name)
+        if key is None:
+            continue
+        if only and not any(o in key for o in only):
+            continue
+        ret[key] = fpath
+    return ret
+
+
+def var_slices(shape, max_elems=MAX_CHUNK_ELEMS):
+    '''Yield index tuples that read a variable in C order, max_elems at a time'''
+    if len(shape) == 0:
+        yield Ellipsis
+        return
+    block = int(np.prod(shape[1:], dtype=np.int64))
+    if block <= max_elems:
+        step = max(1, max_elems // max(block, 1))
+        for i in range(0, shape[0], step):
+            yield (slice(i, min(i+step, shape[0])),)
+    else:
+        for i in range(shape[0]):
+            for sub in var_slices(shape[1:], max_elems):
+                yield (slice(i, i+1),) + sub
+
+
+def is_numeric(var):
+    '''True for numeric variables, char/string variables are skipped like cprnc does'''
+    return np.issubdtype(np.dtype(var.dtype), np.number)
+
+
+def chunk_hash(dat):
+    '''Return the checksum of one chunk of a variable'''
+    return hashlib.sha256(np.ascontiguousarray(dat).tobytes()).hexdigest()
+
+
+def diff_var(tvar, bvar, stored=None):
+    '''Compare two variables chunk by chunk in a single pass over each
+
+    Where a chunk of tvar matches the stored baseline checksum the baseline
+    chunk isn't read. Returns BFB status, the baseline checksums, the max
+    and RMS differences (nan if NaNs differ) and the count of NaN mismatches'''
+    slices = list(var_slices(tvar.shape))
+    if (not isinstance(stored, dict) or stored.get('dtype') != str(bvar.dtype)
+            or len(stored.get('chunks', [])) != len(slices)):
+        stored = None
+    bfb = tvar.dtype == bvar.dtype
+    bsums = []
+    maxdiff = 0.0
+    sumsq = 0.0
+    count = 0
+    nan_diff = 0
+    for i, idx in enumerate(slices):
+        tdat = tvar[idx]
+        thash = chunk_hash(tdat)
+        count += np.size(tdat)
+        if stored is not None and thash == stored['chunks'][i]:
+            bsums.append(thash)
+            continue
+        bdat = bvar[idx]
+        bhash = chunk_hash(bdat)
+        bsums.append(bhash)
+        if thash == bhash:
+            continue
+        bfb = False
+        if np.size(tdat) > 0:
+            tdat = np.asarray(tdat, dtype=np.float64)
+            bdat = np.asarray(bdat, dtype=np.float64)
+            nan_diff += int(np.count_nonzero(np.isnan(tdat) != np.isnan(bdat)))
+            diff = np.abs(tdat - bdat)
+            maxdiff = max(maxdiff, float(np.nanmax(diff, initial=0.0)))
+            sumsq += float(np.nansum(diff*diff))
+    rms = float(np.sqrt(sumsq / count)) if count > 0 else None
+    if nan_diff > 0:
+        # NaNs where the other run has values, don't hide them behind nanmax
+        maxdiff = rms = float('nan')
+    return bfb, {'dtype':str(bvar.dtype), 'chunks':bsums}, maxdiff, rms, nan_diff
+
+
+def compare_file(tpath, bpath, bsums):
+    '''Compare each variable in tpath against bpath, using the stored checksums in bsums
+    to avoid reading unchanged baseline data
+
+    Returns a dictionary of variable results and the baseline checksums'''
+    ret = {}
+    sums = dict(bsums) if bsums else {}
+    with netCDF4.Dataset(tpath, 'r') as tds, netCDF4.Dataset(bpath, 'r') as bds:
+        tds.set_auto_maskandscale(False)
+        bds.set_auto_maskandscale(False)
+        for k in bds.variables.keys() - tds.variables.keys():
+            ret[k] = {'stat':'MISSING_TEST'}
+        for k, tvar in tds.variables.items():
+            if k not in bds.variables:
+                ret[k] = {'stat':'MISSING_BASE'}
+                continue
+            bvar = bds.variables[k]
+            if tvar.shape != bvar.shape:
+                ret[k] = {'stat':'DIMS'}
+                continue
+            if not is_numeric(tvar) and not is_numeric(bvar):
+                # e.g. date_written and time_written always differ between runs
+                ret[k] = {'stat':'SKIPPED'}
+                continue
+            if not is_numeric(tvar) or not is_numeric(bvar):
+                ret[k] = {'stat':'TYPE'}
+                continue
+            bfb, sums[k], maxdiff, rms, nan_diff = diff_var(tvar, bvar, sums.get(k))
+            if bfb:
+                ret[k] = {'stat':'BFB'}
+            else:
+                ret[k] = {'stat':'DIFF', 'max':maxdiff, 'rms':rms, 'nan':nan_diff}
+
+    return ret, sums
+
+
+def read_sums(basedir):
+    '''Read stored baseline checksums from basedir'''
+    spath = basedir / SUMS_FILE_NAME
+    if not spath.exists():
+        return {}
+    with open(spath, 'r', encoding='UTF-8') as f:
+        return json.load(f)
+
+
+def write_sums(basedir, sums):
+    '''Write baseline checksums to basedir'''
+    spath = basedir / SUMS_FILE_NAME
+    try:
+        with open(spath, 'w', encoding='UTF-8') as f:
+            json.dump(sums, f, indent=1)
+    except OSError as err:
+        print(f"- Failed to write baseline checksums to {str(spath)}: {err}")
+
+
+def file_stamp(fpath):
+    '''Size and modification time used to tell if stored checksums are current'''
+    fstat = fpath.stat()
+    return [fstat.st_size, fstat.st_mtime_ns]
+
+
+def compare_runs(tfiles, bfiles, sums, nprocs):
+    '''Compare all files present in both runs in parallel and update sums
+
+    Files only found in one run are reported as MISSING_TEST or MISSING_BASE'''
+    ret = {}
+    jobs = {}
+    for key in sorted(bfiles.keys() - tfiles.keys()):
+        ret[key] = 'MISSING_TEST'
+    with ProcessPoolExecutor(max_workers=nprocs) as pool:
+        for key, tpath in tfiles.items():
+            bpath = bfiles.get(key)
+            if bpath is None:
+                ret[key] = 'MISSING_BASE'
+                continue
+            stored = sums.get(key, {})
+            if stored.get('stamp') != file_stamp(bpath):
+                stored = {}
+            jobs[key] = pool.submit(compare_file, tpath, bpath, stored.get('vars'))
+        for key, job in jobs.items():
+            try:
+                ret[key], fsums = job.result()
+            except Exception as err:
+                # Report any failure for this file and keep going with the rest
+                print(f"- Failed to compare {key}: {type(err).__name__}: {err}")
+                ret[key] = 'ERROR'
+                continue
+            sums[key] = {'stamp':file_stamp(bfiles[key]), 'vars':fsums}
+
+    return ret
+
+
+def summarize_compare(results):
+    '''Create a formatted message with the comparison results, return True if all BFB'''
+    all_bfb = True
+    print('\n\nFile                                     | status | variables differing (max / rms)')
+    print('----------------------------------------------------')
+    for key, res in results.items():
+        if isinstance(res, str):
+            # File level failure: MISSING_TEST, MISSING_BASE or ERROR
+            print(f"{key:40} | FAIL   | {res}")
+            all_bfb = False
+            continue
+        skipped = [k for k, v in res.items() if v['stat'] == 'SKIPPED']
+        skip_str = f"({len(skipped)} non-numeric skipped: {', '.join(sorted(skipped))})" if skipped else ''
+        nbfb = [k for k, v in res.items() if v['stat'] not in ('BFB', 'SKIPPED')]
+        if not nbfb:
+            print(f"{key:40} | BFB    | {skip_str}")
+            continue
+        all_bfb = False
+        print(f"{key:40} | DIFF   | {len(nbfb)} of {len(res) - len(skipped)} {skip_str}")
+        for k in nbfb:
+            v = res[k]
+            if v['stat'] == 'DIFF':
+                nan_str = f", {v['nan']} NaN mismatches" if v['nan'] else ''
+                print(f"{'':40} |        |   {k:24} {v['max']} / {v['rms']}{nan_str}")
+            else:
+                print(f"{'':40} |        |   {k:24} {v['stat']}")
+    print('')
+    print('PASS: all files bit-for-bit' if all_bfb else 'FAIL: differences found')
+    print('')
+    return all_bfb
+
+
+if __name__ == "__main__":
+    args = parse_args()
+
+    logging.basicConfig(filename=LOG_FILE_NAME,
+                        format='%(levelname)s : %(asctime)s : %(message)s',
+                        datefmt='%Y-%m-%d %H:%M:%S',
+                        level=logging.DEBUG)
+
+    test_dir = get_rundir(args.test.resolve())
+    base_dir = get_rundir(args.baseline.resolve())
+    if test_dir is None or base_dir is None:
+        print('- Failed to find run directories to compare')
+        sys.exit(1)
+
+    print(f'Comparing {test_dir} against baseline {base_dir}')
+    test_files = get_file_dict(test_dir, args.files)
+    base_files = get_file_dict(base_dir, args.files)
+    if not test_files and not base_files:
+        print(f'- No netCDF output files found in {test_dir} or {base_dir}')
+        sys.exit(1)
+
+    base_sums = read_sums(base_dir)
+    res_dict = compare_runs(test_files, base_files, base_sums, args.nprocs)
+    if not args.no_store:
+        write_sums(base_dir, base_sums)
+
+    sys.exit(0 if summarize_compare(res_dict) else 1)
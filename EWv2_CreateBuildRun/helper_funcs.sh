@@ -47,7 +47,7 @@ function usage() {
   echo "         [--res=<r_array>] [--compiler=<c_array>] [--ntasks=<nt_array>]"
   echo "         [--stopopt opt_str] [--stopn N] [--pcols N]"
   echo "         [-nc|--no-create] [-nb|-no-build]   [-nr|--no-run]"
-  echo "         [-dr|--dry-run]   [-ow|--overwrite] [-q|--quiet]"
+  echo "         [-dr|--dry-run]   [-ow|--overwrite] [-pk|--pack file] [-q|--quiet]"
   echo "options:"
   echo "  [--srcroot <path>]    : Path to a clone of the EarthWorks repo, default value:"
   echo "                          \"$SRCROOT\""
@@ -73,6 +73,8 @@ function usage() {
   echo "                          This is equivalent to providing \"-nc -nb -nr\""
   echo "  [-ow|--overwrite]     : If a case already exists, delete it first (no effect"
   echo "                          with --no-create provided)"
+  echo "  [-pk|--pack file]     : Instead of case.submit, append case directories to file"
+  echo "                          so they can be run together with pack_cases.py"
   echo "  [-cp|--caseprefix str]: Prepend this value to case names if provided"
   echo "  [-id|--inputdata path]: Use this path instead of the default for DIN_LOC_ROOT"
   echo "  [-q|--quiet]          : Reduce output level, can be supplied twice to suppres"
@@ -233,6 +235,13 @@ while [ $# -ge 1 ]; do
     -ow|--overwrite)
       OVERWRITE=true
       ;;
+    -pk|--pack)
+      if [ -n "$2" ]; then
+        PACK_FILE="$2"; shift
+      else
+        usage 1 "ERROR: --pack must be followed by a path"
+      fi
+      ;;
     -cp|--caseprefix)
       PRE="$2"; shift
       ;;
@@ -267,6 +276,7 @@ done # while [ $# -ge 1 ]
 
 SRCROOT=$(readlink --canonicalize "$SRCROOT")
 CASES_DIR=$(readlink --canonicalize "$CASES_DIR")
+[ -n "$PACK_FILE" ] && PACK_FILE=$(readlink --canonicalize "$PACK_FILE")
 
 if [ ! -d $SRCROOT ]; then
   "ERROR: SRCROOT=\"$SRCROOT\" isn't a valid directory"
@@ -305,6 +315,9 @@ fi
 if [ "${OVERWRITE}" = true ]; then
   DO_STR="${DO_STR}\tOVERWRITE=true"
 fi
+if [ -n "${PACK_FILE}" ]; then
+  DO_STR="${DO_STR}\tPACK_FILE=${PACK_FILE}"
+fi
 
 
 echo -e "Submitting EarthWorks jobs to test ${COMP} compset on $HOSTNAME for $USER"
@@ -0,0 +1,287 @@
+#!/usr/bin/env python3
+'''
+Pack already built cases into as few PBS jobs as possible and run them
+concurrently inside each allocation, instead of one case.submit job per case.
+Each case is run with `./case.submit --no-batch` on its own subset of the
+allocation's nodes, so CIME writes CaseStatus as it would for a normal submit.
+'''
+
+# -- Imports --
+import sys
+import os
+import json
+import time
+import logging
+import subprocess
+from pathlib import Path
+import argparse
+# -- Constants --
+LOG_FILE_NAME='pack_cases.log'
+
+
+def parse_args(args=None):
+    '''Setup command-line arguments and parse them'''
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument("cases",
+            nargs="*",
+            type=Path,
+            help="Case directories to pack into jobs")
+    parser.add_argument("--case-file", "-cf",
+            type=Path,
+            help="File with one case directory per line (as written by the CBR scripts' --pack)")
+    parser.add_argument("--max-nodes", "-mn",
+            type=int,
+            default=8,
+            help="Largest node count to request for one packed job. Default is 8")
+    parser.add_argument("--project", "-A",
+            help="Project key to use for cases that don't set PROJECT")
+    parser.add_argument("--queue", "-q",
+            help="Queue to use for cases that don't set JOB_QUEUE")
+    parser.add_argument("--pack-dir", "-pd",
+            type=Path,
+            default=Path.cwd() / "pack_jobs",
+            help="Where to write job scripts and logs. Default is ./pack_jobs")
+    parser.add_argument("--dry-run", "-dr",
+            action="store_true",
+            help="Write the job scripts, but don't submit them")
+    parser.add_argument("--run-job",
+            type=Path,
+            help=argparse.SUPPRESS)
+
+    opts = parser.parse_args(args)
+    return opts
+
+
+def xmlquery(casedir, var, subgroup=None):
+    '''Return the value of an xml variable for a case, None on failure'''
+    cmd = ['./xmlquery', var, '--value']
+    if subgroup:
+        cmd.extend(['--subgroup', subgroup])
+    proc = subprocess.run(cmd, cwd=casedir, capture_output=True, text=True, check=False)
+    if proc.returncode != 0:
+        msg = f"- Failed to query {var} for case {str(casedir)}"
+        print(msg)
+        print(f'cmd={cmd}\ncmdOut={proc.stdout}{proc.stderr}\n')
+        return None
+    return proc.stdout.strip()
+
+
+def wall_secs(wtime):
+    '''Convert a HH:MM[:SS] wallclock string to seconds'''
+    secs = 0
+    for part in wtime.split(':'):
+        secs = secs*60 + int(part)
+    if wtime.count(':') == 1:
+        secs *= 60
+    return secs
+
+
+def get_case_info(casedir, project=None, queue=None):
+    '''Return a dictionary with the size, wallclock and node resources needed to run a case
+
+    Returns None if any of them can't be determined'''
+    ntasks = xmlquery(casedir, 'TOTALPES')
+    ppn = xmlquery(casedir, 'MAX_MPITASKS_PER_NODE')
+    ncpus = xmlquery(casedir, 'MAX_TASKS_PER_NODE')
+    ngpus = xmlquery(casedir, 'NGPUS_PER_NODE')
+    gtype = xmlquery(casedir, 'GPU_TYPE')
+    wtime = xmlquery(casedir, 'JOB_WALLCLOCK_TIME', subgroup='case.run')
+    cqueue = xmlquery(casedir, 'JOB_QUEUE', subgroup='case.run')
+    cproject = xmlquery(casedir, 'PROJECT')
+    if None in (ntasks, ppn, ncpus, ngpus, gtype, wtime, cqueue, cproject):
+        return None
+    try:
+        ntasks = int(ntasks)
+        ppn = int(ppn)
+        ncpus = int(ncpus)
+        ngpus = max(int(ngpus), 0)
+        wsecs = wall_secs(wtime)
+    except ValueError as err:
+        print(f"- Unexpected xml value for case {str(casedir)}: {err}")
+        return None
+    cqueue = cqueue or queue
+    cproject = cproject or project
+    if not cqueue or not cproject:
+        print(f"- No queue or project for case {str(casedir)}, use --queue/--project")
+        return None
+    if ngpus > 0 and gtype.lower() in ('', 'none'):
+        print(f"- Case {str(casedir)} requests {ngpus} GPUs per node but no GPU_TYPE")
+        return None
+    return {
+        'path':str(casedir),
+        'ntasks':ntasks,
+        'nodes':-(-ntasks // ppn),
+        'walltime':wsecs,
+        # Cases can only share a job if they need the same kind of nodes
+        'resources':{
+            'project':cproject,
+            'queue':cqueue,
+            'ncpus':ncpus,
+            'mpiprocs':ppn,
+            'ngpus':ngpus,
+            'gpu_type':gtype if ngpus > 0 else '',
+            },
+        }
+
+
+def pack_cases(cases, max_nodes):
+    '''First fit decreasing bin packing of cases into jobs of at most max_nodes
+
+    Only cases with the same node resources, queue and project share a job'''
+    bins = []
+    for case in sorted(cases, key=lambda c: (c['nodes'], c['ntasks']), reverse=True):
+        if case['nodes'] > max_nodes:
+            print(f"NOTE: {case['path']} needs {case['nodes']} nodes, it gets its own job")
+        for pbin in bins:
+            if (pbin['resources'] == case['resources']
+                    and pbin['nodes'] + case['nodes'] <= max_nodes):
+                pbin['nodes'] += case['nodes']
+                pbin['cases'].append(case)
+                break
+        else:
+            bins.append({'nodes':case['nodes'], 'resources':case['resources'],
+                         'cases':[case]})
+    return bins
+
+
+def write_job(packdir, name, pbin):
+    '''Write the json description and PBS script for one packed job, return the script path'''
+    jfile = packdir / f'{name}.json'
+    with open(jfile, 'w', encoding='UTF-8') as f:
+        json.dump(pbin, f, indent=1)
+
+    wsecs = max(c['walltime'] for c in pbin['cases'])
+    wtime = f'{wsecs // 3600:02}:{wsecs % 3600 // 60:02}:{wsecs % 60:02}'
+    res = pbin['resources']
+    select = f"{pbin['nodes']}:ncpus={res['ncpus']}:mpiprocs={res['mpiprocs']}"
+    gpu_line = ''
+    if res['ngpus'] > 0:
+        select += f":ngpus={res['ngpus']}"
+        gpu_line = f"#PBS -l gpu_type={res['gpu_type']}\n"
+    pfile = packdir / f'{name}.pbs'
+    with open(pfile, 'w', encoding='UTF-8') as f:
+        f.write(f'''#!/usr/bin/env bash
+#PBS -N {name}
+#PBS -A {res['project']}
+#PBS -q {res['queue']}
+#PBS -l select={select}
+{gpu_line}#PBS -l walltime={wtime}
+#PBS -j oe
+#PBS -o {packdir / f'{name}.out'}
+
+python3 {Path(__file__).resolve()} --run-job {jfile}
+''')
+    return pfile
+
+
+def append_casestatus(casedir, msg):
+    '''Add a message to CaseStatus in the same format CIME uses'''
+    tstamp = time.strftime('%Y-%m-%d %H:%M:%S')
+    with open(Path(casedir) / 'CaseStatus', 'a', encoding='UTF-8') as f:
+        f.write(f'{tstamp}: {msg} \n ---------------------------------------------------\n')
+
+
+def run_job(jfile):
+    '''Inside the allocation, run each case of a packed job on its own nodes and wait for them'''
+    with open(jfile, 'r', encoding='UTF-8') as f:
+        pbin = json.load(f)
+    with open(os.environ['PBS_NODEFILE'], 'r', encoding='UTF-8') as f:
+        nlines = f.read().splitlines()
+    hosts = list(dict.fromkeys(nlines))
+    jobid = os.environ.get('PBS_JOBID', '')
+
+    procs = {}
+    for i, case in enumerate(pbin['cases']):
+        cpath = Path(case['path'])
+        chosts, hosts = set(hosts[:case['nodes']]), hosts[case['nodes']:]
+        nfile = jfile.with_suffix(f'.{i}.nodes')
+        with open(nfile, 'w', encoding='UTF-8') as f:
+            f.write('\n'.join(h for h in nlines if h in chosts) + '\n')
+
+        env = dict(os.environ, PBS_NODEFILE=str(nfile))
+        lfile = jfile.with_suffix(f'.{cpath.name}.log')
+        print(f"+ Starting {cpath.name} on {', '.join(sorted(chosts))}")
+        try:
+            with open(lfile, 'w', encoding='UTF-8') as log:
+                procs[case['path']] = subprocess.Popen(['./case.submit', '--no-batch'],
+                    cwd=cpath, env=env, stdout=log, stderr=subprocess.STDOUT)
+        except OSError as err:
+            print(f"- Failed to start {cpath.name}: {err}")
+            append_casestatus(cpath, f'case.submit error packed job {jobid}')
+            procs[case['path']] = None
+
+    stats = {}
+    for cpath, proc in procs.items():
+        stats[cpath] = proc.wait() if proc is not None else -1
+        print(f"+ {Path(cpath).name} finished with status {stats[cpath]}")
+    with open(jfile.with_suffix('.status'), 'w', encoding='UTF-8') as f:
+        json.dump(stats, f, indent=1)
+
+    return all(s == 0 for s in stats.values())
+
+
+def submit_jobs(pfiles):
+    '''Submit each packed job script with qsub'''
+    for pfile in pfiles:
+        cmd = ['qsub', str(pfile)]
+        proc = subprocess.run(cmd, capture_output=True, text=True, check=False)
+        if proc.returncode != 0:
+            msg = f"- Failed to submit {pfile.name}"
+            print(msg)
+            print(f'cmd={cmd}\ncmdOut={proc.stdout}{proc.stderr}\n')
+        else:
+            print(f"+ Submitted {pfile.name} as {proc.stdout.strip()}")
+
+
+def summarize_pack(bins):
+    '''Create a formatted message with the jobs and the cases in each'''
+    print('\n\nJob      | nodes | cases (nodes/ntasks)')
+    print('----------------------------------------------------')
+    for i, pbin in enumerate(bins):
+        res = pbin['resources']
+        gpus = f", {res['ngpus']} {res['gpu_type']} GPUs/node" if res['ngpus'] > 0 else ''
+        print(f"{i:<8} | queue {res['queue']}, project {res['project']}{gpus}")
+        for j, case in enumerate(pbin['cases']):
+            job = f'{i:<8} | {pbin["nodes"]:5}' if j == 0 else f'{"":8} | {"":5}'
+            print(f"{job} | {Path(case['path']).name} ({case['nodes']}/{case['ntasks']})")
+    print('')
+
+
+if __name__ == "__main__":
+    args = parse_args()
+
+    if args.run_job:
+        sys.exit(0 if run_job(args.run_job) else 1)
+
+    logging.basicConfig(filename=LOG_FILE_NAME,
+                        format='%(levelname)s : %(asctime)s : %(message)s',
+                        datefmt='%Y-%m-%d %H:%M:%S',
+                        level=logging.DEBUG)
+
+    case_dirs = list(args.cases)
+    if args.case_file:
+        with open(args.case_file, 'r', encoding='UTF-8') as cf:
+            case_dirs.extend(Path(l.strip()) for l in cf.read().splitlines() if l.strip())
+    case_infos = []
+    for cdir in dict.fromkeys(c.resolve() for c in case_dirs):
+        info = get_case_info(cdir, args.project, args.queue)
+        if info is None:
+            print(f'- Skipping {cdir}')
+            continue
+        case_infos.append(info)
+    if not case_infos:
+        print('- No cases to pack')
+        sys.exit(1)
+
+    job_bins = pack_cases(case_infos, args.max_nodes)
+    summarize_pack(job_bins)
+
+    args.pack_dir.mkdir(parents=True, exist_ok=True)
+    prefix = time.strftime('pack%Y%m%d_%H%M%S')
+    job_files = [write_job(args.pack_dir.resolve(), f'{prefix}.{i:02}', b)
+                 for i, b in enumerate(job_bins)]
+    if args.dry_run:
+        print(f'Dry run, job scripts written to {args.pack_dir}')
+    else:
+        submit_jobs(job_files)
@@ -7,6 +7,7 @@ to incorporate those changes
 # -- Imports --
 import sys
 import os
+import re
 import logging
 from pathlib import Path
 import argparse
@@ -41,6 +42,9 @@ def parse_args(args=None):
     parser.add_argument("--externals",
             nargs="*",
             help="Only do this for specified externals")
+    parser.add_argument("--all",
+            action="store_true",
+            help="Update every EarthWorks external, even if its upstream tag hasn't changed")
 
     opts = parser.parse_args(args)
     return opts
@@ -119,6 +123,40 @@ def get_update_dict(rootdir, ew_file, cesm_file, cesmtag, exts=None):
     return ret, ew_data
 
 
+def get_last_upstream(tag):
+    '''Return the upstream (name, tag) recorded in the annotation of an EarthWorks tag'''
+    cmd = ['git', 'for-each-ref', '--format=%(contents)', f'refs/tags/{tag}']
+    stat, oput = exe_ret(cmd)
+    if stat != 0 or not oput.strip():
+        # Tag may not be local yet
+        exe_ret(['git', 'fetch', 'origin', 'tag', tag, '--no-tags'])
+        stat, oput = exe_ret(cmd)
+    if stat != 0:
+        return None
+    # Written by tag_branches as: Last changes from upstream '<name>' tag:'<tag>'
+    found = re.findall(r"upstream '([^']*)' tag:'([^']*)'", oput)
+    if not found:
+        return None
+    return found[-1]
+
+
+def skip_unchanged(rootdir, update):
+    '''Remove EarthWorks externals whose upstream tag matches the one last merged'''
+    for k in list(update.keys()):
+        ext = update[k]
+        if ext.get('repo') is None or k == 'ew-model':
+            continue
+        epath = rootdir / ext['local_path']
+        if not epath.is_dir():
+            continue
+        os.chdir(epath)
+        last = get_last_upstream(ext['repo']['tag'])
+        os.chdir(rootdir)
+        if last == (ext['upstream']['name'], ext['upstream']['tag']):
+            print(f"+ External {k} already has upstream tag '{last[1]}', skipping")
+            del update[k]
+
+
 def setup_ewmodel(rootdir, update, ewbranch, ctag):
     '''Ensure that we are using the correct remote, tag, etc for EarthWorksModel'''
     os.chdir(rootdir)
@@ -304,6 +342,7 @@ def getnewtag(otag=None):
 def update_file_externals(rootdir, update, cfg_ext, ctag):
     '''Update EarthWorks Externals.cfg file with new tags or those from CESM Externals.cfg'''
     os.chdir(rootdir)
+    changed = False
     for k, ext in update.items():
         if k == 'ew-model':
             continue
@@ -316,7 +355,13 @@ def update_file_externals(rootdir, update, cfg_ext, ctag):
         else:
             # It's an external that we can copy from CESM
             ntag = ext['upstream']['tag']
+        if cfg_ext.get(k, 'tag', fallback=None) != ntag:
+            changed = True
         cfg_ext.set(k, 'tag', ntag)
+    if not changed:
+        # Every external was skipped or already matches, nothing to commit or tag
+        print('+ No external tags changed, leaving Externals.cfg and EW repo as is')
+        return
     with open(rootdir / 'Externals.cfg', 'w', encoding='UTF-8') as f:
         cfg_ext.write(f)
 
@@ -335,6 +380,7 @@ def update_file_externals(rootdir, update, cfg_ext, ctag):
         msg = '- Failed to commit changes to Externals.cfg in EW repo'
         print(msg)
         print(f'cmd={cmd}\ncmdOut={oput}\n')
+        return
     m_tag = getnewtag()
     t_msgs = [f'Update Externals with tags from {ctag}']
     cmd = ['git', 'tag','-a', m_tag]
@@ -457,6 +503,8 @@ if __name__ == "__main__":
         sys.exit(1)
 
     data_dict.update(u_dict)
+    if not args.all:
+        skip_unchanged(root_dir, data_dict)
     setup_remotes(root_dir, data_dict)
     merge_branches(root_dir, data_dict, cesm_tag)
     tag_branches(root_dir, data_dict, cesm_tag)
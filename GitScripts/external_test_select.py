@@ -0,0 +1,266 @@
+#!/usr/bin/env python3
+'''
+Given the previous and current EarthWorks Externals.cfg, find which externals
+changed tags, which files changed between those tags, and print the minimal
+set of compsets that need to be tested by allcomps_test.sh
+'''
+
+# -- Imports --
+import sys
+import os
+import json
+import logging
+from pathlib import Path
+import argparse
+sys.path.append('../../manage_externals')
+from manic.utils import execute_subprocess
+from manic.externals_description import read_externals_description_file
+from manic.externals_description import create_externals_description
+# -- Constants --
+LOG_FILE_NAME='test_select.log'
+CACHE_DIR = Path.home() / '.cache' / 'ew_test_select'
+
+# Compsets run by allcomps_test.sh
+ALL_COMPSETS = ('FHS94', 'FKESSLER', 'F2000climo', 'QPC6', 'FullyCoupled')
+SIMPLE_COMPSETS = ('FHS94', 'FKESSLER')
+CAM6_COMPSETS = ('F2000climo', 'QPC6', 'FullyCoupled')
+
+# Compsets affected by any change to an external. Externals not listed here
+# (cime, ccs_config, cmeps, share, ...) affect every compset.
+EXT_COMPSETS = {
+    'clm':  ('F2000climo', 'FullyCoupled'),
+    'cice': ('FullyCoupled',),
+}
+
+# Path prefixes within an external and the compsets they affect. The first
+# matching prefix is used; paths that match nothing fall back to EXT_COMPSETS.
+# Only list directories that are specific to a physics package. Shared code
+# (e.g. src/physics/cam, src/physics/utils, src/chemistry/pp_terminator and
+# src/chemistry/utils) is built for every compset and must fall through.
+EXT_PATH_COMPSETS = {
+    'cam': [
+        ('doc/',                ()),
+        ('test/',               ()),
+        ('src/physics/simple/', SIMPLE_COMPSETS),
+        ('src/physics/clubb/',  CAM6_COMPSETS),
+        ('src/physics/pumas/',  CAM6_COMPSETS),
+        ('src/physics/rrtmg/',  CAM6_COMPSETS),
+        ('src/physics/cosp2/',  CAM6_COMPSETS),
+        ('src/physics/silhs/',  CAM6_COMPSETS),
+        ('src/chemistry/modal_aero/',   CAM6_COMPSETS),
+        ('src/chemistry/mozart/',       CAM6_COMPSETS),
+        ('src/chemistry/pp_trop_mam4/', CAM6_COMPSETS),
+        ('bld/namelist_files/use_cases/dctest_baro_kessler', ('FKESSLER',)),
+        ('bld/namelist_files/use_cases/held_suarez',         ('FHS94',)),
+        ('bld/namelist_files/use_cases/aquaplanet',          ('QPC6',)),
+    ],
+}
+
+
+def parse_args(args=None):
+    '''Setup command-line arguments and parse them'''
+    parser = argparse.ArgumentParser()
+
+    dpath = Path.cwd().parents[2]
+    parser.add_argument("--root-dir", "-rd",
+            type=Path,
+            default=dpath,
+            help=f"Location of EarthWorks Model. Default is {dpath}")
+    parser.add_argument("--old-ref", "-or",
+            default="HEAD~1",
+            help="EarthWorks git ref holding the previous Externals.cfg. Default is HEAD~1")
+    parser.add_argument("--new-ref", "-nr",
+            default=None,
+            help="EarthWorks git ref holding the new Externals.cfg. "
+                 "Default is the Externals.cfg in --root-dir")
+    parser.add_argument("--cache-dir",
+            type=Path,
+            default=CACHE_DIR,
+            help=f"Where to cache changed files per tag pair. Default is {CACHE_DIR}")
+    parser.add_argument("--format", "-f",
+            choices=['list', 'bash'],
+            default='list',
+            help="'list' prints one compset per line, 'bash' prints a COMPS=(...) "
+                 "line for allcomps_test.sh")
+    parser.add_argument("--externals",
+            nargs="*",
+            help="Only do this for specified externals")
+
+    opts = parser.parse_args(args)
+    return opts
+
+
+def exe_ret(cmd):
+    '''Use manic.execute subprocess and return the status and output'''
+    return execute_subprocess(cmd, status_to_caller=True, output_to_caller=True)
+
+
+def get_ref_extcfg(rootdir, ref):
+    '''Write the Externals.cfg from EarthWorks git ref to a file and return its path'''
+    if ref is None:
+        return rootdir / 'Externals.cfg'
+    fpath = rootdir / f"Externals.{ref.replace('/', '_').replace('~', '-')}.cfg"
+    cmd = ['git', '-C', str(rootdir), 'show', f'{ref}:Externals.cfg']
+    stat, oput = exe_ret(cmd)
+    if stat != 0:
+        msg = f"- Failed to get Externals.cfg from ref '{ref}'"
+        print(msg, file=sys.stderr)
+        print(f'cmd={cmd}\ncmdOut={oput}\n', file=sys.stderr)
+        return None
+    with open(fpath, 'w', encoding='UTF-8') as f:
+        f.write(oput)
+    return fpath
+
+
+def ext_ref(ext):
+    '''Return the tag (or hash) an external description points to'''
+    repo = ext['repo']
+    return repo.get('tag') or repo.get('hash') or repo.get('branch')
+
+
+def ext_on_branch(ext):
+    '''True if an external description follows a branch instead of a tag or hash'''
+    repo = ext['repo']
+    return not (repo.get('tag') or repo.get('hash'))
+
+
+def get_changed_dict(rootdir, old_file, new_file, exts=None):
+    '''Parse each Externals.cfg file and return a dictionary of externals whose tag changed'''
+    old_data = read_externals_description_file(rootdir, old_file)
+    new_data = read_externals_description_file(rootdir, new_file)
+    old_extdesc = create_externals_description(old_data,
+                    components=exts, exclude=None)
+    new_extdesc = create_externals_description(new_data,
+                    components=exts, exclude=None)
+    ret = {}
+    for k in new_extdesc.keys():
+        n_tag = ext_ref(new_extdesc[k])
+        o_tag = ext_ref(old_extdesc[k]) if k in old_extdesc.keys() else None
+        on_branch = ext_on_branch(new_extdesc[k]) or (
+                    k in old_extdesc.keys() and ext_on_branch(old_extdesc[k]))
+        if n_tag == o_tag and not on_branch:
+            continue
+        ret[k] = {
+          'local_path':new_extdesc[k]['local_path'],
+          'repo_url':new_extdesc[k]['repo']['repo_url'],
+          'old_tag':o_tag,
+          'new_tag':n_tag,
+          'on_branch':on_branch,
+          }
+
+    return ret
+
+
+def cache_file(cachedir, name, otag, ntag):
+    '''Return the cache file used for the changed files of one external tag pair'''
+    pair = f'{otag}..{ntag}'.replace('/', '_')
+    return cachedir / name / f'{pair}.json'
+
+
+def get_changed_paths(rootdir, cachedir, name, ext):
+    '''Return a list of files changed in an external between two tags, None if unknown'''
+    if ext['old_tag'] is None:
+        # New external, there's nothing to diff against
+        return None
+    if ext['on_branch']:
+        # Branches move, so the changes can't be known or cached per tag pair
+        print(f"- External {name} follows a branch, testing all compsets", file=sys.stderr)
+        return None
+
+    cfile = cache_file(cachedir, name, ext['old_tag'], ext['new_tag'])
+    if cfile.exists():
+        with open(cfile, 'r', encoding='UTF-8') as f:
+            return json.load(f)
+
+    epath = rootdir / ext['local_path']
+    if not epath.is_dir():
+        print(f"- External {name} not checked out in {str(epath)}", file=sys.stderr)
+        return None
+    os.chdir(epath)
+
+    cmd = ['git', 'diff', '--name-only', ext['old_tag'], ext['new_tag']]
+    stat, oput = exe_ret(cmd)
+    if stat != 0:
+        # Tags may not be local yet, fetch them and try again
+        for tag in (ext['old_tag'], ext['new_tag']):
+            exe_ret(['git', 'fetch', ext['repo_url'], 'tag', tag, '--no-tags'])
+        stat, oput = exe_ret(cmd)
+    os.chdir(rootdir)
+    if stat != 0:
+        msg = f"- Failed to diff '{ext['old_tag']}' and '{ext['new_tag']}' for {name}"
+        print(msg, file=sys.stderr)
+        print(f'cmd={cmd}\ncmdOut={oput}\n', file=sys.stderr)
+        return None
+
+    paths = oput.splitlines()
+    cfile.parent.mkdir(parents=True, exist_ok=True)
+    with open(cfile, 'w', encoding='UTF-8') as f:
+        json.dump(paths, f)
+    return paths
+
+
+def path_compsets(name, path):
+    '''Return the compsets affected by a change to path in external name'''
+    for prefix, comps in EXT_PATH_COMPSETS.get(name, []):
+        if path.startswith(prefix):
+            return comps
+    return EXT_COMPSETS.get(name, ALL_COMPSETS)
+
+
+def select_compsets(rootdir, cachedir, changed):
+    '''Map the files changed in each external to the compsets that use them'''
+    selected = set()
+    for k, ext in changed.items():
+        paths = get_changed_paths(rootdir, cachedir, k, ext)
+        if paths is None:
+            # Can't tell what changed, be conservative
+            ext['compsets'] = ALL_COMPSETS
+        else:
+            comps = set()
+            for path in paths:
+                comps.update(path_compsets(k, path))
+            ext['compsets'] = tuple(c for c in ALL_COMPSETS if c in comps)
+        selected.update(ext['compsets'])
+
+    return [c for c in ALL_COMPSETS if c in selected]
+
+
+def summarize_select(changed, compsets, out=sys.stderr):
+    '''Create a formatted message with what changed and what needs testing'''
+    print('\n\nExternal   | old tag -> new tag | compsets', file=out)
+    print('----------------------------------------------------', file=out)
+    for k, ext in changed.items():
+        comps = ', '.join(ext['compsets']) or 'None'
+        print(f"{k:10} | {ext['old_tag']} -> {ext['new_tag']} | {comps}", file=out)
+    print('', file=out)
+    print(f"Compsets to test: {', '.join(compsets) or 'None'}", file=out)
+    print('', file=out)
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    root_dir = args.root_dir
+    os.chdir(root_dir)
+
+    logging.basicConfig(filename=LOG_FILE_NAME,
+                        format='%(levelname)s : %(asctime)s : %(message)s',
+                        datefmt='%Y-%m-%d %H:%M:%S',
+                        level=logging.DEBUG)
+
+    old_ext = get_ref_extcfg(root_dir, args.old_ref)
+    new_ext = get_ref_extcfg(root_dir, args.new_ref)
+    if old_ext is None or new_ext is None:
+        print('- Failed to get Externals.cfg files to compare', file=sys.stderr)
+        sys.exit(1)
+
+    changed_dict = get_changed_dict(root_dir, old_ext, new_ext, args.externals)
+    test_comps = select_compsets(root_dir, args.cache_dir, changed_dict)
+
+    # Only the compsets go to stdout so the output can be eval'd or parsed
+    summarize_select(changed_dict, test_comps)
+    if args.format == 'bash':
+        comps_str = ' '.join(f'"{c}"' for c in test_comps)
+        print(f'COMPS=({comps_str})')
+    else:
+        for comp in test_comps:
+            print(comp)